@@ -0,0 +1,43 @@
+import os
+import sys
+import random
+from time import perf_counter
+from types import SimpleNamespace
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+import tetris
+import champion
+
+SIZES = [(10, 20), (20, 40), (40, 80), (80, 160)]
+TICKS = 20000
+KEYS = [pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, None]
+
+def bench(width: int, height: int, ticks: int = TICKS, encode: bool = False, seed: int = 0) -> float:
+    # ticks/sec of a random player, new games are started as old ones top out
+    rng = random.Random(seed)
+    genome = SimpleNamespace(fitness=0)
+    game = tetris.Tetris(genome, seed, width, height)
+    start = perf_counter()
+    for _ in range(ticks):
+        game.update()
+        if not game.running:
+            game = tetris.Tetris(genome, rng.randrange(2 ** 32), width, height)
+            continue
+        if encode:
+            champion.encode(game)
+        key = rng.choice(KEYS)
+        if key is not None:
+            game.keypress(key)
+    return ticks / (perf_counter() - start)
+
+def main() -> None:
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else TICKS
+    print(f"{'board':>9} {'area':>6} {'engine ticks/s':>15} {'+encode ticks/s':>16}")
+    for width, height in SIZES:
+        print(f"{width:>4}x{height:<4} {width * height:>6} {bench(width, height, ticks):>15.0f} "
+              f"{bench(width, height, ticks, encode=True):>16.0f}")
+
+if __name__ == "__main__":
+    main()
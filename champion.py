@@ -0,0 +1,87 @@
+import numpy as np
+
+# numpy only on purpose, main.py loads this without neat installed
+
+CHAMPION_PATH = "champion.npz"
+
+def encode(game) -> list[int]:
+    # same input layout the networks are trained on: one value per grid cell
+    # followed by the one-hot type of the active block. Rows are read one
+    # lower than they are drawn, the top row wrapping around to the bottom.
+    rows = [[0 if block is None else 1 for block in row] for row in game.grid]
+    x = rows[1:] + rows[:1]
+
+    if game.active_block is not None:
+        for square in game.active_block.squares:
+            if -game.height <= square.position.y - 1 < game.height:
+                x[square.position.y - 1][square.position.x] = 2
+
+    bt = game.active_block.block_type if game.active_block is not None else -1
+
+    return [col for row in x for col in row] + [1 if bt == i else 0 for i in range(7)]
+
+class Champion:
+    def __init__(self, weights: np.ndarray, biases: np.ndarray, responses: np.ndarray,
+                 outputs: np.ndarray, num_inputs: int, width: int, height: int) -> None:
+        # row k of weights feeds node k from the value vector [inputs..., nodes...]
+        self.weights = weights
+        self.biases = biases
+        self.responses = responses
+        self.outputs = outputs
+        self.num_inputs = num_inputs
+        # board the network was trained on
+        self.width = width
+        self.height = height
+
+    @classmethod
+    def compile(cls, net, width: int, height: int) -> "Champion":
+        # net is a neat.nn.FeedForwardNetwork, read duck-typed so neat stays optional
+        columns = {key: i for i, key in enumerate(net.input_nodes)}
+        num_inputs = len(columns)
+        for node, *_ in net.node_evals:
+            columns[node] = len(columns)
+        # outputs or sources that are never evaluated stay at 0, like in neat
+        for node, *_, links in net.node_evals:
+            for key, _ in links:
+                columns.setdefault(key, len(columns))
+        for key in net.output_nodes:
+            columns.setdefault(key, len(columns))
+
+        weights = np.zeros((len(net.node_evals), len(columns)))
+        biases = np.zeros(len(net.node_evals))
+        responses = np.zeros(len(net.node_evals))
+        for k, (node, act_func, agg_func, bias, response, links) in enumerate(net.node_evals):
+            if act_func.__name__ != "tanh_activation" or agg_func.__name__ != "sum_aggregation":
+                raise ValueError(f"node {node} uses {act_func.__name__}/{agg_func.__name__}, only tanh/sum can be exported")
+            for key, weight in links:
+                weights[k, columns[key]] += weight
+            biases[k] = bias
+            responses[k] = response
+
+        outputs = np.array([columns[key] for key in net.output_nodes])
+        return cls(weights, biases, responses, outputs, num_inputs, width, height)
+
+    @classmethod
+    def load(cls, path: str = CHAMPION_PATH) -> "Champion":
+        with np.load(path) as data:
+            width, height = data["board"]
+            return cls(data["weights"], data["biases"], data["responses"], data["outputs"], int(data["num_inputs"]),
+                       int(width), int(height))
+
+    def save(self, path: str = CHAMPION_PATH) -> None:
+        np.savez_compressed(path, weights=self.weights, biases=self.biases, responses=self.responses,
+                            outputs=self.outputs, num_inputs=self.num_inputs, board=[self.width, self.height])
+
+    def activate(self, inputs) -> np.ndarray:
+        # accepts one input vector or a (batch, num_inputs) matrix
+        inputs = np.asarray(inputs, dtype=np.float64)
+        values = np.zeros(inputs.shape[:-1] + (self.weights.shape[1],))
+        values[..., :self.num_inputs] = inputs
+        for k in range(len(self.weights)):
+            z = self.biases[k] + self.responses[k] * (values @ self.weights[k])
+            # neat's tanh_activation
+            values[..., self.num_inputs + k] = np.tanh(np.clip(2.5 * z, -60.0, 60.0))
+        return values[..., self.outputs]
+
+    def act(self, inputs) -> int | np.ndarray:
+        return np.argmax(self.activate(inputs), axis=-1)
@@ -0,0 +1,238 @@
+import os
+import time
+import socket
+import queue
+import random
+import argparse
+import threading
+import traceback
+import ipaddress
+import multiprocessing
+from multiprocessing.connection import Listener, Client, Connection
+
+# workers are usually headless, so don't ask SDL for a real display, and
+# don't let it swallow SIGTERM either or they can't be stopped
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_NO_SIGNAL_HANDLERS", "1")
+
+import neat
+import tetris
+import telemetry
+
+HOST, PORT = "127.0.0.1", 6000
+# the connection carries pickles both ways, so the key is all that stands
+# between anyone who can reach the port and running code on either end; the
+# built-in one is only accepted on loopback
+AUTHKEY = b"tetris"
+AUTHKEY_ENV = "TETRIS_AUTHKEY"
+BATCH_SIZE = 10
+PREFETCH = 2
+TIMEOUT = 120.0
+# a batch that has lost this many workers is given up on
+ATTEMPTS = 3
+# seconds __call__ waits for any batch to come back before giving up
+STALL_TIMEOUT = 600.0
+# fitness of a genome whose evaluation raised on the worker
+FAILED_FITNESS = -100.0
+
+def _is_loopback(host: str) -> bool:
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        pass
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except OSError:
+        return False
+
+def check_authkey(host: str, authkey: bytes) -> None:
+    if authkey == AUTHKEY and not _is_loopback(host):
+        raise ValueError(f"{host} is not a loopback address, set your own key with --authkey or ${AUTHKEY_ENV}")
+
+class Coordinator:
+    def __init__(self, address: tuple[str, int] = (HOST, PORT), authkey: bytes = AUTHKEY,
+                 batch_size: int = BATCH_SIZE, prefetch: int = PREFETCH, timeout: float = TIMEOUT,
+                 attempts: int = ATTEMPTS, stall_timeout: float = STALL_TIMEOUT, seed: int | None = None) -> None:
+        check_authkey(address[0], authkey)
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+        self.batch_size = batch_size
+        self.prefetch = prefetch
+        self.timeout = timeout
+        self.attempts = attempts
+        self.stall_timeout = stall_timeout
+        self.rng = random.Random(seed)
+        self.config = None
+        # pending holds (attempt, batch); results holds what workers sent back,
+        # or the exception __call__ should raise
+        self.pending = queue.Queue()
+        self.results = queue.Queue()
+        # batches sent to workers so far, resends included
+        self.dispatched = 0
+        self.dispatched_changed = threading.Condition()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                # listener closed
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn: Connection) -> None:
+        # one thread per worker, keeps up to `prefetch` batches in flight so the
+        # worker never waits on the network between batches
+        inflight = []
+        config = None
+        try:
+            while True:
+                while len(inflight) < self.prefetch:
+                    try:
+                        attempt, batch = self.pending.get(block=not inflight)
+                    except queue.Empty:
+                        break
+                    inflight.append((attempt, batch))
+                    if config is not self.config:
+                        config = self.config
+                        conn.send(("config", config))
+                    conn.send(("batch", batch))
+                    with self.dispatched_changed:
+                        self.dispatched += 1
+                        self.dispatched_changed.notify_all()
+                if not conn.poll(self.timeout):
+                    raise TimeoutError("worker did not answer in time")
+                self.results.put(conn.recv())
+                inflight.pop(0)
+        except (EOFError, OSError):
+            # worker lost, hand its batches to someone else unless they have
+            # already taken down too many
+            for attempt, batch in inflight:
+                if attempt + 1 < self.attempts:
+                    self.pending.put((attempt + 1, batch))
+                else:
+                    keys = [key for key, *_ in batch]
+                    self.results.put(RuntimeError(f"batch {keys} lost {self.attempts} workers, giving up"))
+            conn.close()
+
+    def wait_dispatched(self, count: int, timeout: float | None = None) -> bool:
+        # blocks until `count` batches have gone out, False if timeout ran out first
+        with self.dispatched_changed:
+            return self.dispatched_changed.wait_for(lambda: self.dispatched >= count, timeout)
+
+    def __call__(self, genomes: list[list[int]], config: neat.config.Config) -> None:
+        self.config = config
+        population = dict(genomes)
+        # every genome in a generation plays the same piece sequence
+        seed = self.rng.randrange(2 ** 32)
+        items = [(key, genome, seed) for key, genome in genomes]
+        batches = [items[i:i + self.batch_size] for i in range(0, len(items), self.batch_size)]
+        for batch in batches:
+            self.pending.put((0, batch))
+        for _ in batches:
+            try:
+                item = self.results.get(timeout=self.stall_timeout)
+            except queue.Empty:
+                raise TimeoutError(f"no batch came back in {self.stall_timeout}s, are any workers connected?")
+            if isinstance(item, Exception):
+                raise item
+            results, ticks, step_times = item
+            for key, fitness, error in results:
+                if error is not None:
+                    print(f"genome {key} failed to evaluate, scoring it {FAILED_FITNESS}:\n{error.rstrip()}")
+                    fitness = FAILED_FITNESS
+                population[key].fitness = fitness
+            # fold the workers' counters into ours so telemetry sees them
+            tetris.Tetris.ticks += ticks
+            tetris.Tetris.step_times.merge(*step_times)
+
+    def close(self) -> None:
+        self.listener.close()
+
+def _evaluate(key: int, genome, config: neat.config.Config, seed: int) -> tuple[int, float | None, str | None]:
+    # a genome that raises is reported back rather than taking the worker
+    # down, otherwise its batch would be requeued onto every other worker too
+    try:
+        return key, tetris.evaluate(genome, config, seed), None
+    except Exception:
+        return key, None, traceback.format_exc()
+
+def work(address: tuple[str, int] = (HOST, PORT), authkey: bytes = AUTHKEY, retry: float = 1.0) -> None:
+    # serves until killed; a dropped connection (coordinator gone, or it gave
+    # up on a slow batch) sends the worker back to reconnecting
+    check_authkey(address[0], authkey)
+    while True:
+        try:
+            conn = Client(address, authkey=authkey)
+        except OSError:
+            time.sleep(retry)
+            continue
+
+        config = None
+        with conn:
+            try:
+                while True:
+                    kind, payload = conn.recv()
+                    if kind == "config":
+                        config = payload
+                    elif kind == "batch":
+                        ticks = tetris.Tetris.ticks
+                        results = [_evaluate(key, genome, config, seed) for key, genome, seed in payload]
+                        # a fixed size sample of this batch's step times rather than all of them
+                        step_times = (tetris.Tetris.step_times.count, tetris.Tetris.step_times.samples)
+                        tetris.Tetris.step_times.clear()
+                        conn.send((results, tetris.Tetris.ticks - ticks, step_times))
+            except (EOFError, OSError):
+                pass
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("mode", choices=["coordinator", "worker"])
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--telemetry", type=int, default=None, metavar="PORT")
+    parser.add_argument("--authkey", default=os.environ.get(AUTHKEY_ENV),
+                        help=f"shared secret, defaults to ${AUTHKEY_ENV}; required off loopback")
+    args = parser.parse_args()
+
+    if args.authkey == "":
+        parser.error("--authkey must not be empty")
+    authkey = AUTHKEY if args.authkey is None else args.authkey.encode()
+    try:
+        check_authkey(args.host, authkey)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.mode == "worker":
+        # one worker connection per core on this machine
+        processes = [multiprocessing.Process(target=work, args=((args.host, args.port), authkey)) for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        return
+
+    config = tetris.load_config()
+
+    p = neat.Population(config)
+
+    p.add_reporter(neat.StdOutReporter(True))
+    p.add_reporter(neat.StatisticsReporter())
+
+    if args.telemetry is not None:
+        reporter = telemetry.TelemetryReporter(tetris.Tetris)
+        p.add_reporter(reporter)
+        telemetry.serve(reporter.buffer, port=args.telemetry)
+
+    coordinator = Coordinator((args.host, args.port), authkey, batch_size=args.batch_size)
+    try:
+        winner = p.run(coordinator, 250)
+        tetris.export_champion(winner, config)
+    finally:
+        coordinator.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
+import sys
 import random
+from time import perf_counter
 import pygame
 import copy
-import neat
+import champion
 from enum import Enum
 from dataclasses import dataclass
 
@@ -17,6 +19,13 @@ UPDATE = pygame.USEREVENT + 1
 
 pygame.time.set_timer(UPDATE, 250)
 
+BOARD_WIDTH, BOARD_HEIGHT = 10, 20
+MIN_BOARD_SIZE = 4
+
+# seconds the autoplay network should take to choose a move each update
+AI_BUDGET = 0.005
+AI_MOVES = [pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP]
+
 @dataclass
 class Pair:
     x: int
@@ -95,17 +104,14 @@ class Square:
     WIDTH = 32
     HEIGHT = 32
 
-    squares = []
-
     def __init__(self, position: Pair, color: Color) -> None: 
         self.position = position
         self.color = color
-        Square.squares.append(self)
 
-    def render(self) -> None:
-        x = Tetris.XPOS + self.position.x * Square.WIDTH
-        y = Tetris.YPOS + self.position.y * Square.HEIGHT
-        rect = pygame.Rect(x, y, Square.WIDTH, Square.HEIGHT)
+    def render(self, game: "Tetris") -> None:
+        x = game.xpos + self.position.x * game.cell
+        y = game.ypos + self.position.y * game.cell
+        rect = pygame.Rect(x, y, game.cell, game.cell)
         pygame.draw.rect(WINDOW, self.color.value(), rect)
 
 class Block:
@@ -114,20 +120,21 @@ class Block:
         return list(zip(*block[::-1]))
 
     @classmethod
-    def block_intersect(cls, block: "Block", blocks: list["Block"]) -> bool:
+    def block_intersect(cls, block: "Block", grid: list[list["Block"]]) -> bool:
+        # grid holds the settled block covering each cell, None where empty
         for square in block.squares:
-            for b in blocks:
-                if b is not block:
-                    for s in b.squares:
-                        if square.position == s.position:
-                            return True
+            if 0 <= square.position.y < len(grid) and 0 <= square.position.x < len(grid[0]):
+                if grid[square.position.y][square.position.x] not in (None, block):
+                    return True
         return False
-        # return any(square.position == s.position for square in block.squares for b in blocks if b is not block for s in b.squares)
 
-    def __init__(self, format: BlockFormat, grid_position: Pair) -> None:
+    def __init__(self, format: BlockFormat, grid_position: Pair, width: int = BOARD_WIDTH, height: int = BOARD_HEIGHT) -> None:
         self.block = copy.deepcopy(format.block)
+        self.block_type = list(BLOCKTYPES.values()).index(format)
         self.color = format.color
         self.grid_position = grid_position
+        self.width = width
+        self.height = height
         self.squares = [Square(Pair(0, 0), self.color) for _ in range(4)]
         self._update_squares()
         self.rotation = 0
@@ -141,30 +148,33 @@ class Block:
                 if self.block[i][j] == 1:
                     self.squares[curr].position.x = self.grid_position.x + j
                     self.squares[curr].position.y = self.grid_position.y + i
-                    if self.squares[curr].position.y >= 20:
+                    if self.squares[curr].position.y >= self.height:
                         return False
                     curr += 1
         return True
 
-    def landed(self, blocks: list["Block"]) -> bool:
-        return any(square.position.y >= 19 for square in self.squares) or \
-                any(s1.position.x == s2.position.x and s1.position.y == s2.position.y + 1 for block in blocks if block is not \
-                    self for s1 in block.squares for s2 in self.squares)
+    def landed(self, grid: list[list["Block"]]) -> bool:
+        return len(self.squares) == 0 or any(square.position.y >= self.height - 1 for square in self.squares) or \
+                any(square.position.y >= -1 and grid[square.position.y + 1][square.position.x] not in (None, self)
+                    for square in self.squares)
 
-    def rotate(self, blocks: list["Block"]) -> None:
+    def rotate(self, grid: list[list["Block"]]) -> None:
+        prevx = self.grid_position.x
         self.rotation -= 1
         if self.rotation < 0: self.rotation = 3
         self.block = self.rotations[self.rotation]
-        if not self._update_squares() or Block.block_intersect(self, blocks):
+        # pull the rotated block back inside the walls before checking for overlaps
+        if self._update_squares():
+            self.move([], Direction.Left, 0)
+            self.move([], Direction.Right, 0)
+        if not self._update_squares() or Block.block_intersect(self, grid):
             self.rotation += 1
             if self.rotation > 3: self.rotation = 0
             self.block = self.rotations[self.rotation]
+            self.grid_position.x = prevx
             self._update_squares()
-        else:
-            self.move([], Direction.Left, 0)
-            self.move([], Direction.Right, 0)
 
-    def move(self, blocks: list["Block"], direction: Direction, distance: int = 1) -> None:
+    def move(self, grid: list[list["Block"]], direction: Direction, distance: int = 1) -> None:
         match direction:
             case Direction.Left:
                 # find left most block's column
@@ -177,7 +187,7 @@ class Block:
                 prevx = self.grid_position.x
                 self.grid_position.x = max(self.grid_position.x - distance, -col)
                 self._update_squares()
-                if Block.block_intersect(self, blocks):
+                if Block.block_intersect(self, grid):
                     self.grid_position.x = prevx
                     self._update_squares()
             case Direction.Right:
@@ -189,9 +199,9 @@ class Block:
                         col = i
                         break
                 prevx = self.grid_position.x
-                self.grid_position.x = min(self.grid_position.x + distance, 9 - col)
+                self.grid_position.x = min(self.grid_position.x + distance, self.width - 1 - col)
                 self._update_squares()
-                if Block.block_intersect(self, blocks):
+                if Block.block_intersect(self, grid):
                     self.grid_position.x = prevx
                     self._update_squares()
             case Direction.Down:
@@ -199,72 +209,122 @@ class Block:
                 for square in self.squares:
                     square.position.y += distance
 
-    def render(self) -> None:
+    def render(self, game: "Tetris") -> None:
         for square in self.squares:
-            square.render()
+            square.render(game)
 
-class Tetris:
-    WIDTH = Square.WIDTH * 10
-    HEIGHT = Square.HEIGHT * 20
-    XPOS = (WINDOW_WIDTH - WIDTH) / 2
-    YPOS = (WINDOW_HEIGHT - HEIGHT) / 2
+def check_board(width: int, height: int) -> None:
+    # blocks spawn at x = width // 2 - 2 and are up to 4 cells across and tall
+    if width < MIN_BOARD_SIZE or height < MIN_BOARD_SIZE:
+        raise ValueError(f"board must be at least {MIN_BOARD_SIZE}x{MIN_BOARD_SIZE}, got {width}x{height}")
 
-    def __init__(self):
+class Tetris:
+    def __init__(self, width: int = BOARD_WIDTH, height: int = BOARD_HEIGHT):
+        check_board(width, height)
         self.running = True
+        self.width = width
+        self.height = height
         self.blocks = []
         self.active_block = None
+        # settled blocks by cell, so collisions and line checks never scan every block
+        self.grid = [[None] * width for _ in range(height)]
+        self.row_counts = [0] * height
+        # shrink the squares until the board fits the window
+        self.cell = min(Square.WIDTH, WINDOW_WIDTH // width, WINDOW_HEIGHT // height)
+        self.xpos = (WINDOW_WIDTH - self.cell * width) / 2
+        self.ypos = (WINDOW_HEIGHT - self.cell * height) / 2
+
+    def _place(self, block: Block) -> None:
+        for square in block.squares:
+            if square.position.y >= 0:
+                self.grid[square.position.y][square.position.x] = block
+                self.row_counts[square.position.y] += 1
+
+    def _lift(self, block: Block) -> None:
+        for square in block.squares:
+            if square.position.y >= 0:
+                self.grid[square.position.y][square.position.x] = None
+                self.row_counts[square.position.y] -= 1
 
     def keypress(self, key: int) -> None:
         # key handling
         if self.active_block is None: return
         if key == pygame.K_UP:
-            self.active_block.rotate(self.blocks)
+            self.active_block.rotate(self.grid)
         elif key == pygame.K_LEFT:
-            self.active_block.move(self.blocks, Direction.Left)
+            self.active_block.move(self.grid, Direction.Left)
         elif key == pygame.K_RIGHT:
-            self.active_block.move(self.blocks, Direction.Right)
+            self.active_block.move(self.grid, Direction.Right)
 
     def update(self) -> None:
         if self.active_block is None:
-            # set active block to new block of random type at coordinates 3, -4 on the grid
-            self.active_block = Block(BLOCKTYPES[random.choice(list(BLOCKTYPES.keys()))], Pair(3, -4))
+            # set active block to new block of random type at the top middle of the grid
+            format = BLOCKTYPES[random.choice(list(BLOCKTYPES.keys()))]
+            self.active_block = Block(format, Pair(self.width // 2 - 2, -4), self.width, self.height)
             self.blocks.append(self.active_block)
         else:
-            if self.active_block.landed(self.blocks):
-                update_blocks = []
-                # Checking for line breaks
-                for i in range(19, -1, -1):
-                    squares = [square for block in self.blocks for square in block.squares if square.position.y == i]
-                    if len(squares) == 10:
-                        for square in squares:
-                            for block in self.blocks:
-                                if square in block.squares:
-                                    block.squares.remove(square)
-                                    update_blocks.append(block)
-                # updating line break blocks
-                for block in self.blocks:
-                    while not block.landed(self.blocks):
-                        block.move(self.blocks, Direction.Down)
+            if self.active_block.landed(self.grid):
+                self._place(self.active_block)
+                # Checking for line breaks, only the rows the landed block touches can fill up
+                full = [y for y in {square.position.y for square in self.active_block.squares}
+                        if y >= 0 and self.row_counts[y] == self.width]
+                if full:
+                    for y in full:
+                        for x in range(self.width):
+                            block = self.grid[y][x]
+                            block.squares = [square for square in block.squares if square.position.y != y]
+                            self.grid[y][x] = None
+                        self.row_counts[y] = 0
+                    # updating line break blocks, lowest first so stacks fall in one pass
+                    falling = {block for row in self.grid[:max(full)] for block in row if block is not None}
+                    for block in sorted(falling, key=lambda block: max(square.position.y for square in block.squares), reverse=True):
+                        self._lift(block)
+                        while not block.landed(self.grid):
+                            block.move(self.grid, Direction.Down)
+                        self._place(block)
+                    self.blocks = [block for block in self.blocks if block.squares]
                 # game over check
                 if self.active_block.grid_position.y < 0:
                     self.running = False
                 # ready to set new active block
                 self.active_block = None
             else:
-                self.active_block.move(self.blocks, Direction.Down)
+                self.active_block.move(self.grid, Direction.Down)
 
     def render(self) -> None:
         for block in self.blocks:
-            block.render()
-        for i in range(11):
-            x = Tetris.XPOS + i * Square.WIDTH
-            pygame.draw.line(WINDOW, LIGHTGRAY, (x, Tetris.YPOS), (x, Tetris.YPOS + Tetris.HEIGHT))
-        for i in range(21):
-            y = Tetris.YPOS + i * Square.HEIGHT
-            pygame.draw.line(WINDOW, LIGHTGRAY, (Tetris.XPOS, y), (Tetris.XPOS + Tetris.WIDTH, y))
-
-def main() -> None:
+            block.render(self)
+        for i in range(self.width + 1):
+            x = self.xpos + i * self.cell
+            pygame.draw.line(WINDOW, LIGHTGRAY, (x, self.ypos), (x, self.ypos + self.cell * self.height))
+        for i in range(self.height + 1):
+            y = self.ypos + i * self.cell
+            pygame.draw.line(WINDOW, LIGHTGRAY, (self.xpos, y), (self.xpos + self.cell * self.width, y))
+
+def autoplay(game: Tetris, ai: champion.Champion) -> bool:
+    # the move is always played so games stay reproducible; returns whether
+    # choosing it went over AI_BUDGET
+    start = perf_counter()
+    move = int(ai.act(champion.encode(game)))
+    if move < len(AI_MOVES):
+        game.keypress(AI_MOVES[move])
+    return perf_counter() - start > AI_BUDGET
+
+def main(champion_path: str | None = None) -> None:
     game = Tetris()
+    ai = None
+    if champion_path is not None:
+        ai = champion.Champion.load(champion_path)
+        # the network only fits the board it was trained on
+        game = Tetris(ai.width, ai.height)
+        # first numpy call is slow, keep it out of the budget
+        ai.act(champion.encode(game))
+        start = perf_counter()
+        ai.act(champion.encode(game))
+        elapsed = perf_counter() - start
+        if elapsed > AI_BUDGET:
+            print(f"warning: {champion_path} takes {elapsed * 1000:.1f}ms per move, over the {AI_BUDGET * 1000:.0f}ms budget")
+    overruns = 0
 
     while game.running:
         for event in pygame.event.get():
@@ -272,11 +332,16 @@ def main() -> None:
                 game.running = False
             elif event.type == UPDATE:
                 game.update()
-            elif event.type == pygame.KEYDOWN:
+                if ai is not None and game.running:
+                    overruns += autoplay(game, ai)
+            elif event.type == pygame.KEYDOWN and ai is None:
                 game.keypress(event.key)
         WINDOW.fill(BLACK)
         game.render()
         pygame.display.update()
 
+    if overruns:
+        print(f"{overruns} moves went over the {AI_BUDGET * 1000:.0f}ms budget")
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
\ No newline at end of file
@@ -0,0 +1,210 @@
+import os
+import json
+import random
+from types import SimpleNamespace
+import numpy as np
+
+# recording plays headless games, no window needed
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import neat
+import tetris
+import champion
+
+CHUNK = 4096
+BATCH_SIZE = 4096
+
+def position_dtype(width: int = tetris.BOARD_WIDTH, height: int = tetris.BOARD_HEIGHT) -> np.dtype:
+    # one fixed size record per position: the settled cells packed 8 to a byte,
+    # the block about to spawn and the blocks queued after it
+    return np.dtype([
+        ("board", np.uint8, ((width * height + 7) // 8,)),
+        ("piece", np.uint8),
+        ("queue", np.uint8, (tetris.QUEUE_LENGTH,)),
+    ])
+
+def _shapes() -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # cell offsets and horizontal extent of every block type in every rotation,
+    # rotations indexed the same way as Block.rotations
+    cells = np.zeros((len(tetris.BLOCKINDICES), 4, 4, 2), dtype=np.int64)
+    left = np.zeros((len(tetris.BLOCKINDICES), 4), dtype=np.int64)
+    right = np.zeros((len(tetris.BLOCKINDICES), 4), dtype=np.int64)
+    for t, name in enumerate(tetris.BLOCKINDICES):
+        curr = tetris.BLOCKTYPES[name].block
+        for r in range(4):
+            matrix = np.array(curr)
+            cells[t, r] = np.argwhere(matrix == 1)
+            cols = np.flatnonzero(matrix.any(axis=0))
+            left[t, r], right[t, r] = cols[0], cols[-1]
+            curr = tetris.Block.rotate_matrix(curr)
+    return cells[..., 0], cells[..., 1], left, right
+
+CELL_Y, CELL_X, LEFT, RIGHT = _shapes()
+
+def _board_path(path: str) -> str:
+    # the records don't say which board they were packed from, a sidecar does
+    return path + ".json"
+
+class PositionWriter:
+    def __init__(self, path: str, width: int = tetris.BOARD_WIDTH, height: int = tetris.BOARD_HEIGHT) -> None:
+        board = {"width": width, "height": height}
+        if os.path.exists(_board_path(path)):
+            with open(_board_path(path)) as file:
+                existing = json.load(file)
+            if existing != board:
+                raise ValueError(f"{path} holds {existing['width']}x{existing['height']} positions, not {width}x{height}")
+        else:
+            with open(_board_path(path), "w") as file:
+                json.dump(board, file)
+        self.file = open(path, "ab")
+        self.chunk = np.zeros(CHUNK, dtype=position_dtype(width, height))
+        self.size = 0
+
+    def write(self, game: tetris.Tetris) -> None:
+        board = np.array([[block is not None for block in row] for row in game.grid])
+        record = self.chunk[self.size]
+        record["board"] = np.packbits(board.ravel())
+        record["piece"] = game.active_block.block_type
+        record["queue"] = [tetris.BLOCKINDICES.index(name) for name in game.queue]
+        self.size += 1
+        if self.size == CHUNK:
+            self.flush()
+
+    def flush(self) -> None:
+        self.chunk[:self.size].tofile(self.file)
+        self.file.flush()
+        self.size = 0
+
+    def close(self) -> None:
+        self.flush()
+        self.file.close()
+
+    def __enter__(self) -> "PositionWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def load(path: str) -> np.ndarray:
+    with open(_board_path(path)) as file:
+        board = json.load(file)
+    dtype = position_dtype(board["width"], board["height"])
+    # numpy can't map a zero length file, and a writer that saw no positions leaves one
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+def record(path: str, genome, config: neat.config.Config, games: int, seed: int | None = None,
+           max_ticks: int | None = None) -> None:
+    # appends every spawn position seen while genome plays `games` games
+    if max_ticks is None:
+        max_ticks = config.max_ticks
+    rng = random.Random(seed)
+    net = neat.nn.FeedForwardNetwork.create(genome, config)
+    # games score into a throwaway holder so genome.fitness is left alone
+    holder = SimpleNamespace(fitness=0)
+    with PositionWriter(path, config.board_width, config.board_height) as writer:
+        for _ in range(games):
+            holder.fitness = 0
+            game = tetris.Tetris(holder, rng.randrange(2 ** 32), config.board_width, config.board_height)
+            active = None
+            for _ in range(max_ticks):
+                if not tetris.step(game, net):
+                    break
+                if game.active_block is not None and game.active_block is not active:
+                    active = game.active_block
+                    writer.write(game)
+
+def _collides(board: np.ndarray, ys: np.ndarray, xs: np.ndarray) -> np.ndarray:
+    _, height, width = board.shape
+    rows = np.arange(len(board))[:, None]
+    outside = (xs < 0) | (xs >= width) | (ys >= height)
+    inside = ~outside & (ys >= 0)
+    hit = board[rows, np.clip(ys, 0, height - 1), np.clip(xs, 0, width - 1)] & inside
+    return (outside | hit).any(axis=1)
+
+def _encode(board: np.ndarray, piece: np.ndarray, ys: np.ndarray, xs: np.ndarray) -> np.ndarray:
+    # vectorized champion.encode, including its habit of shifting every row up
+    # by one and wrapping negative rows around to the bottom
+    height = board.shape[1]
+    rows = np.arange(len(board))[:, None]
+    grid = np.roll(board, -1, axis=1).astype(np.int8)
+    shifted = ys - 1
+    visible = shifted >= -height
+    grid[np.broadcast_to(rows, ys.shape)[visible], shifted[visible] % height, xs[visible]] = 2
+    onehot = np.zeros((len(board), len(tetris.BLOCKINDICES)), dtype=np.int8)
+    onehot[np.arange(len(board)), piece] = 1
+    return np.concatenate([grid.reshape(len(board), -1), onehot], axis=1)
+
+def _drop(ai: champion.Champion, board: np.ndarray, piece: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # plays the spawned piece to the floor the way tetris.step does, one
+    # decision per tick, for a whole batch at once
+    n, height, width = board.shape
+    rows = np.arange(n)[:, None]
+    rot = np.zeros(n, dtype=np.int64)
+    x = np.full(n, width // 2 - 2)
+    y = np.full(n, -4)
+    falling = np.ones(n, dtype=bool)
+    topped = np.zeros(n, dtype=bool)
+
+    while True:
+        ys, xs = y[:, None] + CELL_Y[piece, rot], x[:, None] + CELL_X[piece, rot]
+        move = ai.act(_encode(board, piece, ys, xs))
+
+        # left / right, clamped to the walls like Block.move
+        for direction, wanted in ((-1, 0), (1, 1)):
+            nx = x + direction
+            nx = np.maximum(nx, -LEFT[piece, rot]) if direction < 0 else np.minimum(nx, width - 1 - RIGHT[piece, rot])
+            ok = falling & (move == wanted) & ~_collides(board, y[:, None] + CELL_Y[piece, rot], nx[:, None] + CELL_X[piece, rot])
+            x = np.where(ok, nx, x)
+
+        # rotate like Block.rotate, pulled back inside the walls afterwards
+        nrot = (rot - 1) % 4
+        nx = np.clip(x, -LEFT[piece, nrot], width - 1 - RIGHT[piece, nrot])
+        ok = falling & (move == 2) & ~_collides(board, y[:, None] + CELL_Y[piece, nrot], nx[:, None] + CELL_X[piece, nrot])
+        rot = np.where(ok, nrot, rot)
+        x = np.where(ok, nx, x)
+
+        ys, xs = y[:, None] + CELL_Y[piece, rot], x[:, None] + CELL_X[piece, rot]
+        below = ys + 1
+        landed = (ys >= height - 1).any(axis=1) | \
+            (board[rows, np.clip(below, 0, height - 1), xs] & (below >= 0)).any(axis=1)
+        lock = falling & landed
+        if lock.any():
+            visible = lock[:, None] & (ys >= 0)
+            board[np.broadcast_to(rows, ys.shape)[visible], ys[visible], xs[visible]] = True
+            topped |= lock & (y < 0)
+            falling &= ~lock
+        if not falling.any():
+            return board, topped
+        y = np.where(falling, y + 1, y)
+
+def score(ai: champion.Champion, positions: np.ndarray, batch_size: int = BATCH_SIZE) -> np.ndarray:
+    # reward of every position, same terms the live fitness uses; positions is
+    # read batch by batch so a memmap never has to fit in memory
+    width, height = ai.width, ai.height
+    if positions.dtype["board"].shape[0] != (width * height + 7) // 8:
+        raise ValueError(f"positions were not recorded on the {width}x{height} board the network plays")
+    rewards = np.zeros(len(positions), dtype=np.float32)
+    for start in range(0, len(positions), batch_size):
+        batch = positions[start:start + batch_size]
+        board = np.unpackbits(batch["board"], axis=1)[:, :width * height]
+        board = board.reshape(len(batch), height, width).astype(bool)
+        board, topped = _drop(ai, board, batch["piece"].astype(np.int64))
+
+        full = board.all(axis=2)
+        lines = full.sum(axis=1)
+        # drop the cleared rows and let everything above fall
+        order = np.argsort(~full, axis=1, kind="stable")
+        board = np.take_along_axis(board, order[:, :, None], axis=1)
+        board[np.arange(height)[None, :] < lines[:, None]] = False
+
+        heights = np.where(board.any(axis=1), height - board.argmax(axis=1), 0)
+        bumpiness = np.abs(np.diff(heights, axis=1)).sum(axis=1)
+        rewards[start:start + len(batch)] = 150 * lines + \
+            1 / (0.5 * heights.sum(axis=1) + 0.18 * bumpiness + 1) - 50 * topped
+    return rewards
+
+def score_genome(genome, config: neat.config.Config, positions: np.ndarray, batch_size: int = BATCH_SIZE) -> float:
+    ai = champion.Champion.compile(neat.nn.FeedForwardNetwork.create(genome, config), config.board_width, config.board_height)
+    return float(score(ai, positions, batch_size).mean())
@@ -0,0 +1,164 @@
+import os
+import csv
+import time
+import random
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# trials train headless in worker processes
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import neat
+import tetris
+
+# keys are "Section.option" in `config`
+SPACE = {
+    "NEAT.pop_size": [50, 100, 250],
+    "DefaultSpeciesSet.compatibility_threshold": [2.0, 3.0, 4.0],
+    "DefaultGenome.conn_add_prob": [0.1, 0.2, 0.4],
+    "DefaultGenome.node_add_prob": [0.1, 0.2, 0.4],
+    "DefaultGenome.num_hidden": [0, 2, 4],
+}
+GENERATIONS = 2
+ETA = 2
+OUTPUT_PATH = "sweep.csv"
+
+class Fitness:
+    # fitness function for headless trials, one piece sequence per generation
+    def __init__(self, seed: int | None = None) -> None:
+        self.rng = random.Random(seed)
+
+    def __call__(self, genomes: list[list[int]], config: neat.config.Config) -> None:
+        seed = self.rng.randrange(2 ** 32)
+        for _, genome in genomes:
+            tetris.evaluate(genome, config, seed)
+
+def grid(space: dict[str, list]) -> list[dict]:
+    return [dict(zip(space, values)) for values in itertools.product(*space.values())]
+
+def sample(space: dict[str, list], trials: int, seed: int | None = None) -> list[dict]:
+    rng = random.Random(seed)
+    return [{key: rng.choice(values) for key, values in space.items()} for _ in range(trials)]
+
+def _train(path: str, overrides: dict, population: neat.Population | None, fitness: Fitness,
+           generations: int) -> tuple[neat.Population, Fitness, float, float]:
+    # runs in a worker process; the population comes back so the next rung continues it
+    start, cpu = time.perf_counter(), time.process_time()
+    if population is None:
+        population = neat.Population(tetris.load_config(path, overrides=overrides))
+    try:
+        population.run(fitness, generations)
+    except neat.CompleteExtinctionException:
+        pass
+    return population, fitness, time.process_time() - cpu, time.perf_counter() - start
+
+def sweep(trials: list[dict], path: str = tetris.CONFIG_PATH, generations: int = GENERATIONS, eta: int = ETA,
+          workers: int | None = None, budget: float | None = None, seed: int | None = None) -> list[dict]:
+    # successive halving: every surviving trial trains up to `generations`, the
+    # best 1/eta go on to eta times as many, until one is left or the cpu
+    # budget (seconds, summed over workers) would be exceeded
+    rng = random.Random(seed)
+    # every trial plays the same piece sequence in the same generation
+    fitness_seed = rng.randrange(2 ** 32)
+    results = [{"overrides": overrides, "population": None, "fitness": Fitness(fitness_seed),
+                "generations": 0, "best_fitness": None, "wall": 0.0, "cpu": 0.0} for overrides in trials]
+    if budget is not None:
+        results = _admit(results, path, generations, budget, rng)
+    alive = results
+    with ProcessPoolExecutor(workers) as pool:
+        while alive:
+            futures = {
+                pool.submit(_train, path, trial["overrides"], trial["population"], trial["fitness"],
+                            generations - trial["generations"]): trial
+                for trial in alive
+            }
+            for future in as_completed(futures):
+                _record(futures[future], *future.result())
+
+            alive = sorted(alive, key=_rank)[:max(1, len(alive) // eta)]
+            if len(futures) == 1:
+                break
+            generations *= eta
+            spent = sum(trial["cpu"] for trial in results)
+            upcoming = sum(trial["cpu"] / max(1, trial["generations"]) * (generations - trial["generations"])
+                           for trial in alive)
+            if budget is not None and spent + upcoming > budget:
+                break
+
+    for trial in results:
+        del trial["population"], trial["fitness"]
+    return sorted(results, key=_rank)
+
+def _record(trial: dict, population: neat.Population, fitness: Fitness, cpu: float, wall: float) -> None:
+    trial["population"] = population
+    trial["fitness"] = fitness
+    trial["generations"] = population.generation
+    trial["best_fitness"] = population.best_genome.fitness if population.best_genome else None
+    trial["cpu"] += cpu
+    trial["wall"] += wall
+
+def _admit(trials: list[dict], path: str, generations: int, budget: float, rng: random.Random) -> list[dict]:
+    # the first rung alone can blow the budget, so one generation of a random
+    # trial is timed up front and only as many trials as that cost per genome
+    # affords are kept; the probed trial keeps its generation
+    trials = rng.sample(trials, len(trials))
+    probe = trials[0]
+    _record(probe, *_train(path, probe["overrides"], None, probe["fitness"], 1))
+    per_genome = probe["cpu"] / probe["population"].config.pop_size
+    spent = probe["cpu"] * generations
+    admitted = [probe]
+    for trial in trials[1:]:
+        cost = per_genome * tetris.load_config(path, overrides=trial["overrides"]).pop_size * generations
+        if spent + cost > budget:
+            break
+        spent += cost
+        admitted.append(trial)
+    return admitted
+
+def _rank(trial: dict) -> tuple:
+    # most generations first, then best fitness
+    fitness = trial["best_fitness"]
+    return (-trial["generations"], -fitness if fitness is not None else float("inf"))
+
+def write_summary(results: list[dict], path: str = OUTPUT_PATH) -> None:
+    keys = sorted({key for trial in results for key in trial["overrides"]})
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["rank"] + keys + ["generations", "best_fitness", "wall_seconds", "cpu_seconds"])
+        for rank, trial in enumerate(results, 1):
+            writer.writerow([rank] + [trial["overrides"].get(key) for key in keys] +
+                            [trial["generations"], trial["best_fitness"], round(trial["wall"], 2), round(trial["cpu"], 2)])
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--random", type=int, default=None, metavar="TRIALS", help="sample trials instead of the full grid")
+    parser.add_argument("--param", action="append", default=[], metavar="KEY=V1,V2",
+                        help="search these values instead of SPACE, e.g. NEAT.pop_size=50,100")
+    parser.add_argument("--generations", type=int, default=GENERATIONS)
+    parser.add_argument("--eta", type=int, default=ETA)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--budget", type=float, default=None, metavar="CPU_SECONDS")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--config", default=tetris.CONFIG_PATH)
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    args = parser.parse_args()
+
+    space = SPACE
+    if args.param:
+        space = {key: values.split(",") for key, values in (param.split("=", 1) for param in args.param)}
+    trials = grid(space) if args.random is None else sample(space, args.random, args.seed)
+
+    results = sweep(trials, args.config, generations=args.generations, eta=args.eta, workers=args.workers,
+                    budget=args.budget, seed=args.seed)
+    if len(results) < len(trials):
+        print(f"budget admits {len(results)} of {len(trials)} trials")
+    write_summary(results, args.output)
+
+    for rank, trial in enumerate(results[:10], 1):
+        fitness = trial["best_fitness"] if trial["best_fitness"] is not None else float("nan")
+        print(f"{rank:>3} gen {trial['generations']:>4} fitness {fitness:>10.2f} "
+              f"wall {trial['wall']:>8.1f}s {trial['overrides']}")
+
+if __name__ == "__main__":
+    main()
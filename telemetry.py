@@ -0,0 +1,175 @@
+import os
+import sys
+import json
+import socket
+import random
+import asyncio
+import threading
+from time import perf_counter
+import neat
+
+try:
+    import resource
+except ImportError:
+    # not available on windows, memory is reported as None there
+    resource = None
+
+HOST, PORT = "127.0.0.1", 8765
+CAPACITY = 1024
+SAMPLES = 1024
+POLL_INTERVAL = 0.5
+
+class RingBuffer:
+    # single writer, any number of readers; readers never take a lock, they
+    # just drop slots that were overwritten while they were copying
+    def __init__(self, capacity: int = CAPACITY) -> None:
+        self.slots = [None] * capacity
+        self.count = 0
+
+    def append(self, item) -> None:
+        self.slots[self.count % len(self.slots)] = (self.count, item)
+        self.count += 1
+
+    def snapshot(self, since: int = 0) -> tuple[int, list]:
+        count = self.count
+        start = max(since, count - len(self.slots))
+        items = []
+        for i in range(start, count):
+            slot = self.slots[i % len(self.slots)]
+            if slot is not None and slot[0] == i:
+                items.append(slot[1])
+        return count, items
+
+class Reservoir:
+    # uniform sample of at most `capacity` values out of however many were
+    # appended, so percentiles cover a whole generation at a fixed memory cost
+    def __init__(self, capacity: int = SAMPLES, seed: int | None = None) -> None:
+        self.capacity = capacity
+        self.rng = random.Random(seed)
+        self.samples = []
+        self.count = 0
+
+    def append(self, value: float) -> None:
+        self.count += 1
+        if len(self.samples) < self.capacity:
+            self.samples.append(value)
+        else:
+            i = self.rng.randrange(self.count)
+            if i < self.capacity:
+                self.samples[i] = value
+
+    def merge(self, count: int, samples: list[float]) -> None:
+        # folds in another reservoir's (count, samples), e.g. a remote worker's;
+        # each side contributes in proportion to how many values it has seen
+        mine, theirs = self.count, count
+        keep = 0
+        for _ in range(min(self.capacity, mine + theirs)):
+            if self.rng.randrange(mine + theirs) < mine:
+                keep += 1
+                mine -= 1
+            else:
+                theirs -= 1
+        take = min(self.capacity, self.count + count) - keep
+        self.samples = self.rng.sample(self.samples, keep) + self.rng.sample(samples, min(take, len(samples)))
+        self.count += count
+
+    def clear(self) -> None:
+        self.samples = []
+        self.count = 0
+
+def percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def memory_mb() -> float | None:
+    # current resident memory where /proc has it (linux), otherwise the peak,
+    # which only ever goes up
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macos, kilobytes everywhere else
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+class TelemetryReporter(neat.reporting.BaseReporter):
+    def __init__(self, source, capacity: int = CAPACITY) -> None:
+        # source is anything with a `ticks` counter and a `step_times` Reservoir, i.e. tetris.Tetris
+        self.source = source
+        self.buffer = RingBuffer(capacity)
+        self.generation = None
+        self.start = None
+        self.ticks = 0
+
+    def start_generation(self, generation: int) -> None:
+        self.generation = generation
+        self.start = perf_counter()
+        self.ticks = self.source.ticks
+
+    def post_evaluate(self, config, population, species, best_genome) -> None:
+        elapsed = perf_counter() - self.start
+        fitnesses = [genome.fitness for genome in population.values()]
+        times = sorted(self.source.step_times.samples)
+        self.source.step_times.clear()
+        self.buffer.append({
+            "generation": self.generation,
+            "best_fitness": best_genome.fitness,
+            "mean_fitness": sum(fitnesses) / len(fitnesses),
+            "population": len(population),
+            "species": len(species.species),
+            "species_sizes": {key: len(s.members) for key, s in species.species.items()},
+            "evaluation_seconds": elapsed,
+            "ticks_per_second": (self.source.ticks - self.ticks) / elapsed if elapsed > 0 else None,
+            "step_latency_ms": {
+                name: None if (value := percentile(times, q)) is None else value * 1000
+                for name, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))
+            },
+            "memory_mb": memory_mb(),
+        })
+
+async def _handle(buffer: RingBuffer, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request = await reader.readline()
+        while await reader.readline() not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request.split()
+        path = parts[1].decode() if len(parts) > 1 else "/"
+
+        if path == "/stream":
+            # server sent events, one message per generation
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n\r\n")
+            since = 0
+            while True:
+                since, items = buffer.snapshot(since)
+                for item in items:
+                    writer.write(b"data: " + json.dumps(item).encode() + b"\n\n")
+                await writer.drain()
+                await asyncio.sleep(POLL_INTERVAL)
+        elif path in ("/", "/stats"):
+            body = json.dumps(buffer.snapshot()[1]).encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n")
+            writer.write(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+        else:
+            writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def _serve(buffer: RingBuffer, sock: socket.socket) -> None:
+    server = await asyncio.start_server(lambda r, w: _handle(buffer, r, w), sock=sock)
+    async with server:
+        await server.serve_forever()
+
+def serve(buffer: RingBuffer, host: str = HOST, port: int = PORT) -> threading.Thread:
+    # bind here so a bad or busy port raises in the caller; the event loop
+    # lives on its own daemon thread so slow clients never stall training
+    sock = socket.create_server((host, port))
+    thread = threading.Thread(target=asyncio.run, args=(_serve(buffer, sock),), daemon=True)
+    thread.start()
+    return thread
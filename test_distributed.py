@@ -0,0 +1,32 @@
+import threading
+import multiprocessing
+
+import neat
+import tetris
+import distributed
+
+def test_lost_worker_batches_are_requeued():
+    config = tetris.load_config(overrides={"NEAT.pop_size": 10})
+    genomes = list(neat.Population(config).population.items())
+    coordinator = distributed.Coordinator(("127.0.0.1", 0), batch_size=2, seed=0)
+    workers = [multiprocessing.Process(target=distributed.work, args=(coordinator.address,), kwargs={"retry": 0.1},
+                                       daemon=True) for _ in range(2)]
+    try:
+        # only the first worker is up when the generation starts, so it is
+        # holding batches when it gets killed
+        workers[0].start()
+        generation = threading.Thread(target=coordinator, args=(genomes, config), daemon=True)
+        generation.start()
+        assert coordinator.wait_dispatched(coordinator.prefetch, 30), "worker never picked up a batch"
+        workers[0].kill()
+        workers[0].join()
+
+        workers[1].start()
+        generation.join(60)
+        assert not generation.is_alive()
+        assert all(genome.fitness is not None for _, genome in genomes)
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.kill()
+        coordinator.close()
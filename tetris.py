@@ -1,10 +1,17 @@
+import os
+import sys
 import random
+import tempfile
+import configparser
 from time import perf_counter
 import pygame
 import copy
 import neat
+from collections import deque
 from enum import Enum
 from dataclasses import dataclass
+import telemetry
+import champion
 
 WINDOW_WIDTH, WINDOW_HEIGHT = 640, 640
 BLACK = (0, 0, 0)
@@ -18,6 +25,13 @@ UPDATE = pygame.USEREVENT + 1
 
 pygame.time.set_timer(UPDATE, 100)
 
+CONFIG_PATH = "./config"
+BOARD_WIDTH, BOARD_HEIGHT = 10, 20
+MIN_BOARD_SIZE = 4
+# default game length when config has no [Board] max_ticks
+MAX_TICKS = 5000
+QUEUE_LENGTH = 5
+
 @dataclass
 class Pair:
     x: int
@@ -106,17 +120,14 @@ class Square:
     WIDTH = 32
     HEIGHT = 32
 
-    squares = []
-
     def __init__(self, position: Pair, color: Color) -> None: 
         self.position = position
         self.color = color
-        Square.squares.append(self)
 
-    def render(self) -> None:
-        x = Tetris.XPOS + self.position.x * Square.WIDTH
-        y = Tetris.YPOS + self.position.y * Square.HEIGHT
-        rect = pygame.Rect(x, y, Square.WIDTH, Square.HEIGHT)
+    def render(self, game: "Tetris") -> None:
+        x = game.xpos + self.position.x * game.cell
+        y = game.ypos + self.position.y * game.cell
+        rect = pygame.Rect(x, y, game.cell, game.cell)
         pygame.draw.rect(WINDOW, self.color.value(), rect)
 
 class Block:
@@ -125,15 +136,19 @@ class Block:
         return list(zip(*block[::-1]))
 
     @classmethod
-    def block_intersect(cls, block: "Block", blocks: list["Block"]) -> bool:
-        return any(square.position == s.position for square in block.squares for b in blocks if b is not block for s in b.squares)
+    def block_intersect(cls, block: "Block", grid: list[list["Block"]]) -> bool:
+        # grid holds the settled block covering each cell, None where empty
+        return any(0 <= square.position.y < len(grid) and 0 <= square.position.x < len(grid[0]) and
+                   grid[square.position.y][square.position.x] not in (None, block) for square in block.squares)
 
-    def __init__(self, format_name: str, grid_position: Pair) -> None:
+    def __init__(self, format_name: str, grid_position: Pair, width: int = BOARD_WIDTH, height: int = BOARD_HEIGHT) -> None:
         format = BLOCKTYPES[format_name]
         self.block = copy.deepcopy(format.block)
         self.block_type = BLOCKINDICES.index(format_name)
         self.color = format.color
         self.grid_position = grid_position
+        self.width = width
+        self.height = height
         self.squares = [Square(Pair(0, 0), self.color) for _ in range(4)]
         self._update_squares()
         self.rotation = 0
@@ -147,30 +162,33 @@ class Block:
                 if self.block[i][j] == 1:
                     self.squares[curr].position.x = self.grid_position.x + j
                     self.squares[curr].position.y = self.grid_position.y + i
-                    if self.squares[curr].position.y >= 20:
+                    if self.squares[curr].position.y >= self.height:
                         return False
                     curr += 1
         return True
 
-    def landed(self, blocks: list["Block"]) -> bool:
-        return len(self.squares) == 0 or any(square.position.y >= 19 for square in self.squares) or \
-                any(s1.position.x == s2.position.x and s1.position.y == s2.position.y + 1 for block in blocks if block is not \
-                    self for s1 in block.squares for s2 in self.squares)
+    def landed(self, grid: list[list["Block"]]) -> bool:
+        return len(self.squares) == 0 or any(square.position.y >= self.height - 1 for square in self.squares) or \
+                any(square.position.y >= -1 and grid[square.position.y + 1][square.position.x] not in (None, self)
+                    for square in self.squares)
 
-    def rotate(self, blocks: list["Block"]) -> None:
+    def rotate(self, grid: list[list["Block"]]) -> None:
+        prevx = self.grid_position.x
         self.rotation -= 1
         if self.rotation < 0: self.rotation = 3
         self.block = self.rotations[self.rotation]
-        if not self._update_squares() or Block.block_intersect(self, blocks):
+        # pull the rotated block back inside the walls before checking for overlaps
+        if self._update_squares():
+            self.move([], Direction.Left, 0)
+            self.move([], Direction.Right, 0)
+        if not self._update_squares() or Block.block_intersect(self, grid):
             self.rotation += 1
             if self.rotation > 3: self.rotation = 0
             self.block = self.rotations[self.rotation]
+            self.grid_position.x = prevx
             self._update_squares()
-        else:
-            self.move([], Direction.Left, 0)
-            self.move([], Direction.Right, 0)
 
-    def move(self, blocks: list["Block"], direction: Direction, distance: int = 1) -> None:
+    def move(self, grid: list[list["Block"]], direction: Direction, distance: int = 1) -> None:
         match direction:
             case Direction.Left:
                 # find left most block's column
@@ -183,7 +201,7 @@ class Block:
                 prevx = self.grid_position.x
                 self.grid_position.x = max(self.grid_position.x - distance, -col)
                 self._update_squares()
-                if Block.block_intersect(self, blocks):
+                if Block.block_intersect(self, grid):
                     self.grid_position.x = prevx
                     self._update_squares()
             case Direction.Right:
@@ -195,9 +213,9 @@ class Block:
                         col = i
                         break
                 prevx = self.grid_position.x
-                self.grid_position.x = min(self.grid_position.x + distance, 9 - col)
+                self.grid_position.x = min(self.grid_position.x + distance, self.width - 1 - col)
                 self._update_squares()
-                if Block.block_intersect(self, blocks):
+                if Block.block_intersect(self, grid):
                     self.grid_position.x = prevx
                     self._update_squares()
             case Direction.Down:
@@ -205,151 +223,239 @@ class Block:
                 for square in self.squares:
                     square.position.y += distance
 
-    def render(self) -> None:
+    def render(self, game: "Tetris") -> None:
         for square in self.squares:
-            square.render()
+            square.render(game)
+
+def check_board(width: int, height: int) -> None:
+    # blocks spawn at x = width // 2 - 2 and are up to 4 cells across and tall
+    if width < MIN_BOARD_SIZE or height < MIN_BOARD_SIZE:
+        raise ValueError(f"board must be at least {MIN_BOARD_SIZE}x{MIN_BOARD_SIZE}, got {width}x{height}")
 
 class Tetris:
-    WIDTH = Square.WIDTH * 10
-    HEIGHT = Square.HEIGHT * 20
-    XPOS = (WINDOW_WIDTH - WIDTH) / 2
-    YPOS = (WINDOW_HEIGHT - HEIGHT) / 2
+    # process wide counters, read by the telemetry reporter
+    ticks = 0
+    step_times = telemetry.Reservoir()
 
-    def __init__(self, genome):
+    def __init__(self, genome, seed: int | None = None, width: int = BOARD_WIDTH, height: int = BOARD_HEIGHT):
+        check_board(width, height)
         self.running = True
         self.genome = genome
+        self.rng = random.Random(seed)
+        self.queue = deque(self.rng.choice(BLOCKINDICES) for _ in range(QUEUE_LENGTH))
+        self.width = width
+        self.height = height
         self.blocks = []
         self.active_block = None
+        # settled blocks by cell, so collisions and line checks never scan every block
+        self.grid = [[None] * width for _ in range(height)]
+        self.row_counts = [0] * height
+        self.heights = [0] * width
+        self.bumpiness = 0
+        self.aggregate_height = 0
+        # shrink the squares until the board fits the window
+        self.cell = min(Square.WIDTH, WINDOW_WIDTH // width, WINDOW_HEIGHT // height)
+        self.xpos = (WINDOW_WIDTH - self.cell * width) / 2
+        self.ypos = (WINDOW_HEIGHT - self.cell * height) / 2
+
+    def _place(self, block: Block) -> None:
+        for square in block.squares:
+            if square.position.y >= 0:
+                self.grid[square.position.y][square.position.x] = block
+                self.row_counts[square.position.y] += 1
+                self.heights[square.position.x] = max(self.heights[square.position.x], self.height - square.position.y)
+
+    def _lift(self, block: Block) -> None:
+        for square in block.squares:
+            if square.position.y >= 0:
+                self.grid[square.position.y][square.position.x] = None
+                self.row_counts[square.position.y] -= 1
 
     def keypress(self, key: int) -> None:
         # key handling
         if self.active_block is None: return
         if key == pygame.K_UP:
-            self.active_block.rotate(self.blocks)
+            self.active_block.rotate(self.grid)
         elif key == pygame.K_LEFT:
-            self.active_block.move(self.blocks, Direction.Left)
+            self.active_block.move(self.grid, Direction.Left)
         elif key == pygame.K_RIGHT:
-            self.active_block.move(self.blocks, Direction.Right)
+            self.active_block.move(self.grid, Direction.Right)
 
     def update(self) -> None:
+        Tetris.ticks += 1
         if self.active_block is None:
-            # set active block to new block of random type at coordinates 3, -4 on the grid
-            self.active_block = Block(random.choice(list(BLOCKTYPES.keys())), Pair(3, -4))
+            # set active block to the next queued type at the top middle of the grid
+            self.active_block = Block(self.queue.popleft(), Pair(self.width // 2 - 2, -4), self.width, self.height)
+            self.queue.append(self.rng.choice(BLOCKINDICES))
             self.blocks.append(self.active_block)
         else:
-            if self.active_block.landed(self.blocks):
-                update_blocks = []
-                # Checking for line breaks
-                for i in range(19, -1, -1):
-                    squares = [square for block in self.blocks for square in block.squares if square.position.y == i]
-                    if len(squares) == 10:
+            if self.active_block.landed(self.grid):
+                self._place(self.active_block)
+                # Checking for line breaks, only the rows the landed block touches can fill up
+                full = [y for y in {square.position.y for square in self.active_block.squares}
+                        if y >= 0 and self.row_counts[y] == self.width]
+                if full:
+                    for y in full:
                         self.genome.fitness += 150
-                        for square in squares:
-                            for block in self.blocks:
-                                if square in block.squares:
-                                    block.squares.remove(square)
-                                    update_blocks.append(block)
-                # updating line break blocks
-                for block in self.blocks:
-                    if block is self.active_block: continue
-                    while not block.landed(self.blocks):
-                        block.move(self.blocks, Direction.Down)
+                        for x in range(self.width):
+                            block = self.grid[y][x]
+                            block.squares = [square for square in block.squares if square.position.y != y]
+                            self.grid[y][x] = None
+                        self.row_counts[y] = 0
+                    # updating line break blocks, lowest first so stacks fall in one pass
+                    falling = {block for row in self.grid[:max(full)] for block in row if block is not None}
+                    falling.discard(self.active_block)
+                    for block in sorted(falling, key=lambda block: max(square.position.y for square in block.squares), reverse=True):
+                        self._lift(block)
+                        while not block.landed(self.grid):
+                            block.move(self.grid, Direction.Down)
+                        self._place(block)
+                    self.blocks = [block for block in self.blocks if block.squares]
+                    self.heights = [next((self.height - y for y in range(self.height) if self.grid[y][x] is not None), 0)
+                                    for x in range(self.width)]
+                self.bumpiness = sum(abs(self.heights[i] - self.heights[i - 1]) for i in range(1, self.width))
+                self.aggregate_height = sum(self.heights)
                 # game over check
                 if self.active_block.grid_position.y < 0:
                     self.running = False
                 # ready to set new active block
                 self.active_block = None
             else:
-                self.active_block.move(self.blocks, Direction.Down)
-        mhpc = [0 for _ in range(10)]
-        for block in self.blocks:
-            if block is self.active_block: continue
-            for square in block.squares:
-                mhpc[square.position.x] = max(mhpc[square.position.x], square.position.y)
-        self.bumpiness = sum(abs(mhpc[i] - mhpc[i - 1]) for i in range(1, 10))
-        self.aggregate_height = sum(mhpc)
+                self.active_block.move(self.grid, Direction.Down)
 
     def render(self) -> None:
         for block in self.blocks:
-            block.render()
-        for i in range(11):
-            x = Tetris.XPOS + i * Square.WIDTH
-            pygame.draw.line(WINDOW, LIGHTGRAY, (x, Tetris.YPOS), (x, Tetris.YPOS + Tetris.HEIGHT))
-        for i in range(21):
-            y = Tetris.YPOS + i * Square.HEIGHT
-            pygame.draw.line(WINDOW, LIGHTGRAY, (Tetris.XPOS, y), (Tetris.XPOS + Tetris.WIDTH, y))
+            block.render(self)
+        for i in range(self.width + 1):
+            x = self.xpos + i * self.cell
+            pygame.draw.line(WINDOW, LIGHTGRAY, (x, self.ypos), (x, self.ypos + self.cell * self.height))
+        for i in range(self.height + 1):
+            y = self.ypos + i * self.cell
+            pygame.draw.line(WINDOW, LIGHTGRAY, (self.xpos, y), (self.xpos + self.cell * self.width, y))
+
+def load_config(path: str = CONFIG_PATH, width: int | None = None, height: int | None = None,
+                overrides: dict[str, object] | None = None) -> neat.config.Config:
+    parameters = configparser.ConfigParser()
+    if not parameters.read(path):
+        raise FileNotFoundError(f"No such config file: {os.path.abspath(path)}")
+    # overrides are keyed "Section.option", e.g. {"NEAT.pop_size": 100}
+    for key, value in (overrides or {}).items():
+        section, option = key.split(".", 1)
+        if not parameters.has_section(section):
+            parameters.add_section(section)
+        parameters[section][option] = str(value)
+    if not parameters.has_section("Board"):
+        parameters.add_section("Board")
+    if width is not None:
+        parameters["Board"]["width"] = str(width)
+    if height is not None:
+        parameters["Board"]["height"] = str(height)
+    width = parameters.getint("Board", "width", fallback=BOARD_WIDTH)
+    height = parameters.getint("Board", "height", fallback=BOARD_HEIGHT)
+    check_board(width, height)
+    # the network sees every cell of the board plus the active block's type
+    parameters["DefaultGenome"]["num_inputs"] = str(width * height + len(BLOCKINDICES))
+
+    # neat only reads configs from disk
+    with tempfile.NamedTemporaryFile("w", suffix=".cfg", delete=False) as file:
+        parameters.write(file)
+    try:
+        config = neat.config.Config(
+            neat.DefaultGenome, neat.DefaultReproduction, neat.DefaultSpeciesSet, neat.DefaultStagnation, file.name
+        )
+    finally:
+        os.remove(file.name)
+    config.board_width = width
+    config.board_height = height
+    config.max_ticks = parameters.getint("Board", "max_ticks", fallback=MAX_TICKS)
+    return config
+
+def step(game: Tetris, net: neat.nn.FeedForwardNetwork) -> bool:
+    start = perf_counter()
+    game.update()
+
+    if not game.running:
+        game.genome.fitness -= 50
+        return False
+
+    game.genome.fitness += 1 / (0.5 * game.aggregate_height + 0.18 * game.bumpiness + 1)
+
+    outputs = net.activate(champion.encode(game))
+    output = outputs.index(max(outputs))
+
+    if output == 0:
+        game.keypress(pygame.K_LEFT)
+    elif output == 1:
+        game.keypress(pygame.K_RIGHT)
+    elif output == 2:
+        game.keypress(pygame.K_UP)
+
+    Tetris.step_times.append(perf_counter() - start)
+    return True
+
+def evaluate(genome, config: neat.config.Config, seed: int | None = None, max_ticks: int | None = None) -> float:
+    # headless single game, used by the distributed workers and the sweep;
+    # cut off at config.max_ticks like the games in run()
+    if max_ticks is None:
+        max_ticks = config.max_ticks
+    genome.fitness = 0
+    net = neat.nn.FeedForwardNetwork.create(genome, config)
+    game = Tetris(genome, seed, config.board_width, config.board_height)
+    for _ in range(max_ticks):
+        if not step(game, net):
+            break
+    return genome.fitness
 
-def run(genomes: list[list[int]], config: neat.config.Config) -> None:
+def export_champion(genome, config: neat.config.Config, path: str = champion.CHAMPION_PATH) -> None:
+    net = neat.nn.FeedForwardNetwork.create(genome, config)
+    champion.Champion.compile(net, config.board_width, config.board_height).save(path)
 
-    nets = []
-    ge = []
+def run(genomes: list[list[int]], config: neat.config.Config) -> None:
 
-    for _, g in genomes:
+    # fixed slots, games[i] is always played by nets[i] for genome ge[i]
+    ge = [g for _, g in genomes]
+    for g in ge:
         g.fitness = 0
-        ge.append(g)
-        nets.append(neat.nn.FeedForwardNetwork.create(g, config))
+    nets = [neat.nn.FeedForwardNetwork.create(g, config) for g in ge]
+    games = [Tetris(g, width=config.board_width, height=config.board_height) for g in ge]
+
+    # slots still playing, compacted every tick so finished games cost nothing
+    active = list(range(len(games)))
 
     running = True
-    
-    games = [Tetris(ge[i]) for i in range(len(ge))]
+    ticks = 0
 
     while running:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
-            elif event.type == UPDATE:
-                for i, game in enumerate(games):
-                    game.update()
-
-                    if not game.running:
-                        game.genome.fitness -= 50
-                        ge.pop(i)
-                        games.pop(i)
-                        continue
-
-                    game.genome.fitness += 1 / (0.5 * game.aggregate_height + 0.18 * game.bumpiness + 1)
-
-                    x = [[0 for _ in range(10)] for _ in range(20)]
+            elif event.type == UPDATE and ticks < config.max_ticks:
+                active = [i for i in active if step(games[i], nets[i])]
+                ticks += 1
 
-                    for block in game.blocks:
-                        for square in block.squares:
-                            try:
-                                x[square.position.y - 1][square.position.x] = 2 if block is game.active_block else 1
-                            except:
-                                pass
-
-                    bt = game.active_block.block_type if game.active_block is not None else -1
-
-                    outputs = nets[i].activate([col for row in x for col in row] + 
-                                                [1 if bt == i else 0 for i in range(7)])
-                    output = outputs.index(max(outputs))
-
-                    if output == 0:
-                        game.keypress(pygame.K_LEFT)
-                    elif output == 1:
-                        game.keypress(pygame.K_RIGHT)
-                    elif output == 2:
-                        game.keypress(pygame.K_UP)
-
-        if len(ge) == 0:
+        # games still going at max_ticks end there, same as in evaluate()
+        if len(active) == 0 or ticks >= config.max_ticks:
             break
 
         WINDOW.fill(BLACK)
-        games[0].render()
+        games[active[0]].render()
         pygame.display.update()
 
-def main() -> None:
-    config_path = "./config"
-    config = neat.config.Config(
-        neat.DefaultGenome, neat.DefaultReproduction, neat.DefaultSpeciesSet, neat.DefaultStagnation, config_path
-    )
+def main(telemetry_port: int | None = None) -> None:
+    config = load_config()
 
     p = neat.Population(config)
 
     p.add_reporter(neat.StdOutReporter(True))
     p.add_reporter(neat.StatisticsReporter())
 
-    p.run(run, 250)
+    if telemetry_port is not None:
+        reporter = telemetry.TelemetryReporter(Tetris)
+        p.add_reporter(reporter)
+        telemetry.serve(reporter.buffer, port=telemetry_port)
+
+    winner = p.run(run, 250)
+    export_champion(winner, config)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else None)
\ No newline at end of file